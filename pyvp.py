@@ -18,28 +18,162 @@
  #                                                                            #
  ##############################################################################
 
+import argparse
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import operator
 import os
+import signal
 import sys
-import time
+import threading
 import termcolors
 import vcml
 
 from typing import List
 from collections import namedtuple
-from vcml import Session, Attribute, Command
+from vcml import Session, Attribute, Command, Trie, ProtocolError
+from vcml.module import walk, CHUNK
+from vcml.profiler import Profiler
+from vcml.snapshot import Snapshot
+from vcml.sweep import parse_time, sweep_quantum
 
+try:
+    import readline
+except ImportError:
+    readline = None
+
+WATCH_FILE = os.path.expanduser("~/.pyvp_watches.json")
+
+
+class Completer:
+    def __init__(self, app):
+        self.app = app
+        self.session = None
+        self.tries = {}
+        self.matches = []
+        self.kinds = {
+            "cd": "modules",
+            "read": "attributes",
+            "exec": "commands",
+            "stepi": "targets",
+            "break": "targets",
+            "watch": "attributes",
+        }
+
+    def install(self):
+        readline.set_completer(self.complete)
+        readline.set_completer_delims(" \t")
+        if "libedit" in (readline.__doc__ or ""):
+            readline.parse_and_bind("bind ^I rl_complete")
+        else:
+            readline.parse_and_bind("tab: complete")
+
+    def invalidate(self):
+        self.session = None
+        self.tries = {}
+
+    def update(self):
+        if self.session is self.app.session:
+            return
+
+        self.tries = {kind: Trie() for kind in self.kinds.values()}
+        self.session = self.app.session
+        if not self.session:
+            return
+
+        stack = [([m.name], m) for m in self.session.modules]
+        while stack:
+            path, m = stack.pop()
+            self.tries["modules"].insert(path)
+            for a in m.attributes:
+                self.tries["attributes"].insert(path + [a.name])
+            for c in m.commands:
+                self.tries["commands"].insert(path + [c.name])
+            stack.extend((path + [sub.name], sub) for sub in m.modules)
+
+        for t in self.session.targets:
+            self.tries["targets"].insert(t.name.split("."))
+
+    def candidates(self, words: List[str], text: str) -> List[str]:
+        self.update()
+        current = self.app.current
+        if not words:
+            names = list(self.app.commands) + list(self.app.aliases)
+            if current:
+                names += [c.name for c in current.commands]
+                names += [a.name for a in current.attributes]
+            return sorted(n for n in set(names) if n.startswith(text))
+
+        command = self.app.aliases.get(words[0], words[0])
+        trie = self.tries.get(self.kinds.get(command))
+        if not trie:
+            return []
+
+        matches = trie.complete(text)
+        if current:
+            base = current.hierarchy_name() + "."
+            matches += [m[len(base):] for m in trie.complete(base + text)]
+
+        # descend into a unique submodule right away, since readline
+        # would otherwise terminate the completed word with a space
+        if len(matches) == 1 and matches[0].endswith("."):
+            return self.candidates(words, matches[0]) or matches
+        return sorted(set(matches))
+
+    def complete(self, text: str, state: int):
+        if state == 0:
+            line = readline.get_line_buffer()[:readline.get_begidx()]
+            self.matches = self.candidates(line.split(), text)
+        return self.matches[state] if state < len(self.matches) else None
+
+
+class Monitor(threading.Thread):
+    def __init__(self, app, interval: float):
+        super().__init__(daemon=True)
+        self.app = app
+        self.session = app.session
+        self.interval = interval
+        self.status = self.session.status(False)
+        self.error = None
+        self.quit = threading.Event()
+
+    def run(self):
+        try:
+            while not self.quit.wait(self.interval):
+                self.status = self.session.status()
+                self.app.show_status()
+                if not self.status.running:
+                    return
+        except Exception as err:
+            self.error = err
+
+    def finish(self):
+        self.quit.set()
+        self.join()
 
 class Application:
-    def __init__(self):
+    def __init__(self, address=None, attach=False, profiler=None):
         self.session = None
         self.current = None
         self.prevcmd = ["none"]
+        self.completer = None
+        self.monitor = None
+        self.idle = False
+        self.profiler = profiler
+        self.watches = []
+        self.watched = None
+        self.watch_stamp = None
+        self.watch_base = {}
+        self.watch_values = {}
 
         Handler = namedtuple("Handler", "func needs_session desc")
         self.commands = {
             "connect": Handler(self.handle_connect, False,
                 "connect to a local simulation on <port> or to a remote one " +
-                "on <host>:<port>"),
+                "on <host>:<port>, use -a to attach without stopping it"),
             "disconnect": Handler(self.handle_disconnect, True,
                 "disconnect from the current session without terminating it"),
             "quit": Handler(self.handle_quit, False,
@@ -49,23 +183,60 @@ class Application:
             "info": Handler(self.handle_info, True,
                 "print information about the current session"),
             "step": Handler(self.handle_step, True,
-                "advances simulation to the next discrete timestamp"),
+                "advances simulation by [n] quanta"),
             "stepi": Handler(self.handle_stepi, True,
-                "step target one instruction"),
+                "steps [n] instructions on the given [targets] or the " +
+                "current one"),
             "run": Handler(self.handle_run, True,
-                "continues simulation, use CTRL+C to interrupt"),
+                "continues simulation, use CTRL+C to interrupt or -b " +
+                "[interval] to keep running in the background"),
+            "stop": Handler(self.handle_stop, True,
+                "stops a simulation running in the background"),
+            "quantum": Handler(self.handle_quantum, True,
+                "prints or sets the simulation quantum, e.g. 'quantum 10us'"),
+            "sweep": Handler(self.handle_sweep, True,
+                "measures simulation speed running <interval> for each of " +
+                "the given <quanta...>"),
+            "until": Handler(self.handle_until, True,
+                "runs until <attribute> <op> <value> holds, optionally " +
+                "for at most [limit], e.g. 'until uart0.status == 2 10ms'"),
             "list": Handler(self.handle_list, True,
-                "displays the module hierarchy onwards from current module"),
+                "displays the module hierarchy onwards from current module, " +
+                "use -r to recurse with -d <depth>, -k <kinds>, -f <pattern>, " +
+                "-n <count> and -o <offset>"),
+            "dump": Handler(self.handle_dump, True,
+                "writes modules and attributes onwards from current module " +
+                "to stdout or [file], use -d <depth> to limit recursion"),
             "cd": Handler(self.handle_cd, True,
                 "moves current module to <module>"),
+            "refresh": Handler(self.handle_refresh, True,
+                "reloads the module hierarchy from the simulation"),
             "exec": Handler(self.handle_exec, True,
                 "executes the given <command> [args...]"),
             "read": Handler(self.handle_read, True,
                 "reads the given <attribute>"),
+            "watch": Handler(self.handle_watch, True,
+                "shows the given attributes with every prompt, use " +
+                "'watch add|del <attributes...>' or 'watch list'"),
+            "snapshot": Handler(self.handle_snapshot, True,
+                "saves all attribute values onwards from current module " +
+                "to <file>"),
+            "diff": Handler(self.handle_diff, False,
+                "compares the attribute values of two snapshot <files>"),
             "break": Handler(self.handle_break, True,
-                "sets a breakpoint for the given target"),
+                "sets a breakpoint at <address> for the given targets, " +
+                "lists breakpoints without arguments or saves/loads them " +
+                "with -s/-l <file>"),
             "delete": Handler(self.handle_delete, True,
-                "delete a breakpoint with the given ID"),
+                "delete the breakpoints with the given IDs"),
+            "speedlog": Handler(self.handle_speedlog, True,
+                "appends simulation speed samples to a .csv or .jsonl " +
+                "<file>, or stops logging with 'off'"),
+            "profile": Handler(self.handle_profile, False,
+                "executes <command> [args...] and reports where pyvp spent " +
+                "time and memory"),
+            "history": Handler(self.handle_history, True,
+                "dumps the most recent protocol packets to stderr or <file>"),
             "help": Handler(self.handle_help, False, "prints this message"),
         }
 
@@ -82,18 +253,31 @@ class Application:
             "ls": "list",
             "x": "exec",
             "r": "read",
+            "w": "watch",
             "b": "break",
             "h": "help",
         }
 
+        self.background = ["read", "watch", "list", "dump", "cd", "info", "refresh", "history",
+                           "speedlog", "help", "stop", "connect", "disconnect", "kill",
+                           "quit"]
+
         self.help = []
         for c in self.commands:
             alias = [k for k, v in self.aliases.items() if str(v) == c]
             self.help.append([c] + alias)
 
+        if readline and sys.stdin.isatty():
+            self.completer = Completer(self)
+            self.completer.install()
+
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.handle_sigusr1)
+
         try:
-            if len(sys.argv) >= 2:
-                self.execute(["connect"] + sys.argv[-1:])
+            if address:
+                args = ["connect", address]
+                self.execute(args + ["-a"] if attach else args)
         except Exception as err:
             print("\n{}{}{}".format(termcolors.RED, err, termcolors.RESET))
 
@@ -121,45 +305,162 @@ class Application:
             cmd = self.session.find_command(name)
         return cmd
 
+    def header(self, status) -> str:
+        if not self.session:
+            return "{}[ no session ]{}".format(
+                termcolors.RED + termcolors.BOLD, termcolors.RESET)
+
+        if self.monitor:
+            text = "{}[running {:.9f}s | {} | {}]{}".format(
+                termcolors.TIMESTAMP, status.time / 1e9, status.cycle,
+                self.session.meter, termcolors.RESET)
+        else:
+            text = "{}[{:.9f}s]{}".format(termcolors.TIMESTAMP,
+                                          status.time / 1e9, termcolors.RESET)
+        text += " " + termcolors.SESSION + str(self.session) + termcolors.RESET
+        if self.current:
+            text += " " + termcolors.MODULE + str(self.current) + \
+                    termcolors.RESET
+        return text
+
     def prompt(self):
-        sys.stdout.write("\n")
-        if self.session:
-            sys.stdout.write("{}[{:.9f}s]{}".format(
-                termcolors.TIMESTAMP, self.session.time() / 1e9,
-                termcolors.RESET))
-            sys.stdout.write(" " + termcolors.SESSION +
-                             str(self.session) + termcolors.RESET)
-            if self.current:
-                sys.stdout.write(" {}".format(
-                    termcolors.MODULE + str(self.current) + termcolors.RESET))
-            sys.stdout.write("\n")
+        if self.monitor and not self.monitor.is_alive():
+            self.finish_monitor()
+
+        status = None
+        if self.monitor:
+            status = self.monitor.status
+        elif self.session and self.watches:
+            status = self.update_watches()
+        elif self.session:
+            status = self.session.status()
+        sys.stdout.write("\n" + self.header(status) + "\n")
+        if self.session and self.watches:
+            if self.monitor:
+                self.update_watches()
+            self.show_watches()
+
+    def update_watches(self):
+        # one pipelined exchange fetches the status along with all watched
+        # attributes, no matter how many watches there are
+        if self.watched is None:
+            self.watched = [self.session.find_attribute(name)
+                            for name in self.watches]
+        attrs = [a for a in self.watched if a]
+        reqs = [a.request() for a in attrs if a.count]
+        if self.monitor:
+            res = [None] + self.session.pipeline(reqs)
         else:
-            print("{}[ no session ]{}".format(termcolors.RED + termcolors.BOLD,
-                                              termcolors.RESET))
-        sys.stdout.write("> ")
+            res = self.session.pipeline(["status"] + reqs)
+            self.session.parse_status(res[0])
+
+        status = self.session.status(False)
+        stamp = (status.time, status.cycle)
+        if stamp != self.watch_stamp:
+            self.watch_stamp = stamp
+            self.watch_base = self.watch_values
+        self.watch_values = {a.hierarchy_name(): str(v) for a, v in
+                             zip(attrs, vcml.session.decode_attributes(
+                                 attrs, res[1:]))}
+        return status
+
+    def show_watches(self):
+        for name in self.watches:
+            val = self.watch_values.get(name, "<missing>")
+            changed = name in self.watch_base and self.watch_base[name] != val
+            print("{}{:<32}{} {}{}{}".format(termcolors.ATTRIBUTE, name,
+                termcolors.RESET, termcolors.CHANGED if changed else "", val,
+                termcolors.RESET if changed else ""))
+
+    def show_status(self):
+        # repaint the header above the input line, but only while the user
+        # is idle at the prompt so that no command output is overwritten
+        if not self.idle or not sys.stdout.isatty():
+            return
+        header = self.header(self.monitor.status)
+        sys.stdout.write("\0337\033[1A\r\033[2K" + header + "\0338")
         sys.stdout.flush()
 
+    def finish_monitor(self, report: bool = True):
+        monitor, self.monitor = self.monitor, None
+        monitor.finish()
+        if monitor.error:
+            raise monitor.error
+        if report:
+            print(f"Stopped by {self.stop_reason()}")
+
+    def stop_reason(self) -> str:
+        event = self.session.stop_event()
+        if event.breakpoint:
+            return f"breakpoint {event.breakpoint}"
+        return event.reason
+
+    def readline(self) -> str:
+        self.idle = True
+        try:
+            if self.completer:
+                return input("> ")
+
+            sys.stdout.write("> ")
+            sys.stdout.flush()
+            line = sys.stdin.readline()
+            if not line:
+                raise EOFError()
+            return line
+        finally:
+            self.idle = False
+
     def run(self):
         while True:
             try:
-                self.prompt()
-                args = sys.stdin.readline().split()
+                if self.profiler:
+                    with self.profiler.section("<prompt>"):
+                        self.prompt()
+                else:
+                    self.prompt()
+                args = self.readline().split()
                 self.execute(args)
 
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError):
                 sys.stdout.write("\nquit\n")
                 return
 
             except Exception as err:
                 print("\n{}{}{}".format(termcolors.RED, err, termcolors.RESET))
+                self.dump_history(err)
                 if isinstance(err, IOError):
                     self.session = None
                     self.current = None
 
+    def dump_history(self, err):
+        if self.session and isinstance(err, (IOError, ProtocolError)):
+            self.session.dump_history()
+
     def execute(self, args):
         if not args:
             args = self.prevcmd
 
+        command, args = self.resolve(args)
+        if self.monitor and command not in self.background:
+            raise Exception("simulation is running in the background, " +
+                            "use 'stop' first")
+        if self.monitor and command in ["connect", "disconnect", "kill",
+                                        "quit"]:
+            self.finish_monitor(False)
+
+        self.invoke(command, args)
+        self.prevcmd = args
+
+    def invoke(self, command, args):
+        # only one profiler can be active at a time, 'profile' brings its own
+        if not self.profiler or command == "profile":
+            self.commands[command].func(args)
+            return
+
+        with self.profiler.section(command):
+            self.commands[command].func(args)
+
+    def resolve(self, args):
         overlay_command = self.find_command(args[0])
         if overlay_command:
             args = ["exec"] + args
@@ -177,19 +478,164 @@ class Application:
         if not self.session and handler.needs_session:
             raise Exception("not connected, use 'connect [host]:<port>'")
 
-        handler.func(args)
-        self.prevcmd = args
+        return command, args
+
+    def run_script(self, lines, address=None, keep_going=False,
+                   attach=False) -> int:
+        termcolors.disable()
+
+        if address:
+            try:
+                self.session = Session(address, not attach)
+            except Exception as err:
+                self.report(["connect", address], error=err)
+                return 2
+
+        status = 0
+        pending = []
+        def flush() -> bool:
+            nonlocal pending
+            batch, pending = pending, []
+            return not batch or self.flush(batch, keep_going)
+
+        for line in lines:
+            args = line.split()
+            if not args or args[0].startswith("#"):
+                continue
+
+            try:
+                command, args = self.resolve(args)
+            except Exception as err:
+                command = None
+                pending.append((args, [], err))
+
+            if command in ["read", "exec", "list"]:
+                entry = self.prepare(command, args)
+                if keep_going or (command != "exec" and
+                                  not isinstance(entry[2], Exception)):
+                    pending.append(entry)
+                    continue
+
+                # without --keep-going nothing is sent past a failure, so a
+                # command with side effects is only sent once all commands
+                # before it succeeded, and a failing command ends the batch
+                if command == "exec" and not flush():
+                    status = 1
+                    break
+                pending.append(entry)
+                if not flush():
+                    status = 1
+                    break
+                continue
+
+            if not flush():
+                status = 1
+                if not keep_going:
+                    break
+
+            if not command:
+                continue
+
+            buf = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(buf):
+                    self.invoke(command, args)
+                self.report(args, result=buf.getvalue().splitlines())
+            except Exception as err:
+                self.report(args, error=err)
+                self.dump_history(err)
+                status = 1
+                if not keep_going:
+                    break
+
+        if not flush():
+            status = 1
+
+        sys.stdout.flush()
+        return status
+
+    def prepare(self, command, args):
+        try:
+            if command == "read":
+                attrs = self.resolve_attributes(args)
+                reqs = [a.request() for a in attrs if a.count]
+                def decode(res):
+                    it = iter(res)
+                    return {a.hierarchy_name():
+                            a.decode(next(it) if a.count else [])
+                            for a in attrs}
+                return (args, reqs, decode)
+
+            if command == "exec":
+                cmd, cmdargs = self.resolve_command(args)
+                return (args, [cmd.request(cmdargs)], lambda res: res[0])
+
+            if "-r" in args:
+                names = [name for _, name in self.list_recursive(args)]
+            else:
+                mods, cmds, attr = self.list_entries(args)
+                names = [x.name for x in mods + cmds + attr]
+            return (args, [], lambda res: names)
+        except Exception as err:
+            return (args, [], err)
+
+    def flush(self, pending, keep_going=False) -> bool:
+        if not self.profiler:
+            return self.flush_batch(pending, keep_going)
+
+        with self.profiler.section("<batch>"):
+            return self.flush_batch(pending, keep_going)
+
+    def flush_batch(self, pending, keep_going=False) -> bool:
+        reqs = [r for _, rs, _ in pending for r in rs]
+        try:
+            results = iter(self.session.pipeline(reqs, False) if reqs else [])
+        except Exception as err:
+            for args, _, _ in pending:
+                self.report(args, error=err)
+            self.dump_history(err)
+            return False
+
+        success = True
+        for args, rs, decode in pending:
+            if not success and not keep_going:
+                break
+            res = [next(results) for _ in rs]
+            errors = [r for r in res if isinstance(r, Exception)]
+            if isinstance(decode, Exception) or errors:
+                self.report(args, error=decode if not errors else errors[0])
+                if errors:
+                    self.dump_history(errors[0])
+                success = False
+                continue
+            try:
+                self.report(args, result=decode(res))
+            except Exception as err:
+                self.report(args, error=err)
+                success = False
+        return success
+
+    def report(self, args, result=None, error=None):
+        record = {"command": " ".join(args), "ok": error is None}
+        if error is None:
+            record["result"] = result
+        else:
+            record["error"] = str(error)
+        sys.stdout.write(json.dumps(record) + "\n")
 
     def handle_connect(self, args):
+        attach = "-a" in args
+        args = [arg for arg in args if arg != "-a"]
         if len(args) != 2:
-            raise Exception("usage: {} [host]:<port>".format(args[0]))
+            raise Exception("usage: {} [host]:<port> [-a]".format(args[0]))
 
         if self.session:
             self.handle_disconnect(args)
 
         print("connecting to {}...".format(args[1]))
-        self.session = Session(args[1])
+        self.session = Session(args[1], not attach)
         print("connected to " + self.session.peer())
+        self.load_watches()
 
     def handle_disconnect(self, args):
         print("disconnecting from session " + str(self.session))
@@ -207,47 +653,107 @@ class Application:
         self.session = None
 
     def handle_step(self, args):
-        self.session.step()
+        if len(args) > 2 or (len(args) == 2 and not args[1].isdigit()):
+            raise Exception(f"usage: {args[0]} [n]")
+        self.session.step(int(args[1]) if len(args) > 1 else 1)
 
     def handle_stepi(self, args):
-        if len(args) == 2:
-            name = self.session.find_target(args[1])
-        else:
-            name = self.current
+        names = args[1:]
+        n = 1
+        if names and names[0].isdigit():
+            n = int(names.pop(0))
+
+        if not names:
+            names = [str(self.current)]
 
-        target = self.session.find_target(name)
-        if not target:
-            raise Exception(f"No such target: {name}")
-        self.session.stepi(target)
+        self.session.stepi_many(names, n)
 
     def handle_run(self, args: List[str]):
+        background = "-b" in args
+        args = [arg for arg in args if arg != "-b"]
+        if len(args) > 2 or (len(args) == 2 and not background):
+            raise Exception(f"usage: {args[0]} [-b [interval]]")
+
+        interval = 0.1
+        if args[1:]:
+            try:
+                interval = float(args[1])
+            except ValueError:
+                raise Exception(f"invalid interval: {args[1]}")
+
         self.session.run()
+        if background:
+            self.monitor = Monitor(self, interval)
+            self.monitor.start()
+            print("simulating in the background, use 'stop' to interrupt")
+            return
+
         stop_reason = "unknown"
         try:
-            while self.session.running():
-                time.sleep(0.1)
-                sys.stdout.write("\033[1000D{}{:<16}{}{:.9f}s | {}".format(
-                    termcolors.HIGHLIGHT, "Simulating...",
-                    termcolors.RESET, self.session.time() / 1e9,
-                    self.session.cycle()))
+            while not self.session.wait(0.1):
+                status = self.session.status(False)
+                sys.stdout.write("\033[1000D{}{:<16}{}{:.9f}s | {} | {}"
+                    "\033[K".format(termcolors.HIGHLIGHT, "Simulating...",
+                    termcolors.RESET, status.time / 1e9, status.cycle,
+                    self.session.meter))
                 sys.stdout.flush()
 
-            stop_reason = self.session.reason()
+            stop_reason = self.stop_reason()
         except KeyboardInterrupt:
             self.session.stop()
         except IOError as err:
+            self.session.dump_history()
             self.current = None
             self.session = None
             stop_reason = str(err)
         print(f"\nStopped by {stop_reason}")
 
+    def handle_stop(self, args):
+        if not self.monitor:
+            raise Exception("simulation is not running in the background")
+
+        self.session.stop()
+        self.session.update_status()
+        self.finish_monitor()
+
+    def handle_quantum(self, args):
+        if len(args) > 2:
+            raise Exception(f"usage: {args[0]} [quantum]")
+        if len(args) == 2:
+            self.session.set_quantum(parse_time(args[1]))
+        print("{}ns".format(self.session.quantum()))
+
+    def handle_sweep(self, args):
+        if len(args) < 3:
+            raise Exception(f"usage: {args[0]} <interval> <quanta...>")
+
+        interval = parse_time(args[1])
+        quanta = [parse_time(arg) for arg in args[2:]]
+        results = sweep_quantum(self.session, quanta, interval)
+        for line in vcml.sweep.report(results):
+            print(line)
+
+    def handle_speedlog(self, args):
+        if len(args) != 2:
+            raise Exception(f"usage: {args[0]} <file>|off")
+
+        if args[1] == "off":
+            self.session.meter.close_log()
+            print("speed logging stopped")
+        else:
+            self.session.meter.open_log(args[1])
+            print(f"logging simulation speed to {args[1]}")
+
     def handle_info(self, args):
         reports = {
             "Simulation Host": self.session.peer(),
             "VCML Version": self.session.vcml_version(),
             "SystemC Version": self.session.sysc_version(),
             "Simulation Time": "{:.9f}s".format(self.session.time() / 1e9),
-            "Delta Cycle": "{}".format(self.session.cycle())
+            "Delta Cycle": "{}".format(self.session.cycle()),
+            "Speed": "{:.4f}x realtime".format(self.session.meter.speed),
+            "Cycle Rate": "{:.0f} cycles/s".format(
+                self.session.meter.cycle_rate),
         }
 
         for r in reports:
@@ -255,48 +761,156 @@ class Application:
                   r, termcolors.RESET, termcolors.WHITE, reports[r],
                   termcolors.RESET))
 
-    def handle_list(self, args):
-        show_mods = "-m" in args
-        show_attr = "-a" in args
-        show_cmds = "-c" in args
+    def list_options(self, args):
+        flags = []
+        opts = {}
+        i = 1
+        while i < len(args):
+            if args[i] in ["-d", "-k", "-f", "-n", "-o"]:
+                if i + 1 == len(args):
+                    raise Exception(f"missing value for {args[i]}")
+                opts[args[i]] = args[i + 1]
+                i += 2
+            else:
+                flags.append(args[i])
+                i += 1
+
+        show = {flag: flag in flags for flag in ["-m", "-a", "-c"]}
+        if not any(show.values()):
+            show = {flag: True for flag in show}
+        return show, opts
 
-        if not show_mods and not show_attr and not show_cmds:
-            show_mods = True
-            show_attr = True
-            show_cmds = True
+    def list_entries(self, args):
+        show, _ = self.list_options(args)
 
         mods = []
         attr = []
         cmds = []
 
-        if show_mods:
+        if show["-m"]:
             if self.current:
                 mods = self.current.modules
             else:
                 mods = self.session.modules
 
-        if show_attr and self.current:
+        if show["-a"] and self.current:
             attr = self.current.attributes
-        if show_cmds and self.current:
+        if show["-c"] and self.current:
             cmds = self.current.commands
 
-        outputs = []
-        for m in mods:
-            outputs.append("{}{:<20}{}".format(
-                termcolors.MODULE, m.name, termcolors.RESET))
-        for c in cmds:
-            outputs.append("{}{:<20}{}".format(
-                termcolors.COMMAND, c.name, termcolors.RESET))
-        for a in attr:
-            outputs.append("{}{:<20}{}".format(
-                termcolors.ATTRIBUTE, a.name, termcolors.RESET))
-
-        for i, s in enumerate(outputs):
-            print(s, end='')
+        return mods, cmds, attr
+
+    def list_recursive(self, args):
+        show, opts = self.list_options(args)
+        start = self.current.modules if self.current else self.session.modules
+        depth = int(opts["-d"]) if "-d" in opts else None
+        kinds = opts["-k"].split(",") if "-k" in opts else None
+
+        def entries():
+            for m in walk(start, depth, kinds, opts.get("-f")):
+                if show["-m"]:
+                    yield termcolors.MODULE, m.hierarchy_name()
+                if show["-c"]:
+                    for c in m.commands:
+                        yield termcolors.COMMAND, c.hierarchy_name()
+                if show["-a"]:
+                    for a in m.attributes:
+                        yield termcolors.ATTRIBUTE, a.hierarchy_name()
+
+        offset = int(opts.get("-o", 0))
+        count = int(opts["-n"]) if "-n" in opts else None
+        return itertools.islice(entries(), offset,
+                                offset + count if count is not None else None)
+
+    def write_lines(self, lines, f=None):
+        f = f or sys.stdout
+        for chunk in iter(lambda: list(itertools.islice(lines, CHUNK)), []):
+            f.write("\n".join(chunk) + "\n")
+        f.flush()
+
+    def handle_until(self, args):
+        ops = {"==": operator.eq, "!=": operator.ne, "<": operator.lt,
+               "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+        if len(args) not in [4, 5] or args[2] not in ops:
+            raise Exception(f"usage: {args[0]} <attribute> <op> <value> " +
+                            "[limit]")
+
+        attr = self.find_attribute(args[1])
+        if not attr:
+            raise Exception(f"no such attribute: {args[1]}")
+
+        name = attr.hierarchy_name()
+        op = ops[args[2]]
+        def predicate(values):
+            try:
+                return op(int(values[name], 0), int(args[3], 0))
+            except (TypeError, ValueError):
+                return op(str(values[name]), args[3])
+
+        # how far a numeric value is from meeting the condition, which lets
+        # the session narrow down the quantum in which it is first met
+        def distance(values):
+            try:
+                val, ref = int(values[name], 0), int(args[3], 0)
+            except (TypeError, ValueError):
+                return None
+            return {"==": abs(ref - val), "<": val - ref + 1, "<=": val - ref,
+                    ">": ref - val + 1, ">=": ref - val}.get(args[2])
+
+        limit = parse_time(args[4]) if len(args) == 5 else None
+        try:
+            event = self.session.run_until(predicate, [attr], limit=limit,
+                                           distance=distance)
+        except KeyboardInterrupt:
+            self.session.stop()
+            print("\nStopped by user")
+            return
+
+        if not event:
+            print(f"{name} {args[2]} {args[3]} not met within {args[4]}")
+            return
+
+        print("{} is {}, condition met between {:.9f}s and {:.9f}s".format(
+            name, event.values[name], event.start / 1e9, event.time / 1e9))
+
+    def handle_list(self, args):
+        if "-r" in args:
+            self.write_lines(color + name + termcolors.RESET
+                             for color, name in self.list_recursive(args))
+            return
+
+        mods, cmds, attr = self.list_entries(args)
+        outputs = itertools.chain(
+            ((termcolors.MODULE, m.name) for m in mods),
+            ((termcolors.COMMAND, c.name) for c in cmds),
+            ((termcolors.ATTRIBUTE, a.name) for a in attr))
+
+        for i, (color, name) in enumerate(outputs):
+            print("{}{:<20}{}".format(color, name, termcolors.RESET), end='')
             if i % 5 == 4:
                 print("")
         print("")
 
+    def handle_dump(self, args):
+        depth = None
+        if "-d" in args:
+            i = args.index("-d")
+            if i + 1 == len(args):
+                raise Exception(f"usage: {args[0]} [-d <depth>] [file]")
+            depth = int(args[i + 1])
+            args = args[:i] + args[i + 2:]
+        if len(args) > 2:
+            raise Exception(f"usage: {args[0]} [-d <depth>] [file]")
+
+        modules = [self.current] if self.current else self.session.modules
+        if len(args) == 1:
+            vcml.module.dump(modules, sys.stdout, depth)
+            return
+
+        with open(args[1], "w") as f:
+            vcml.module.dump(modules, f, depth)
+        print(f"hierarchy written to {args[1]}")
+
     def handle_cd(self, args):
         if len(args) > 2:
             raise Exception(f"Usage: {args[0]} [module|..]")
@@ -310,66 +924,194 @@ class Application:
                 self.current = self.current.parent
             return
 
-        m = self.find_module(args[1])
+        m = self.find_module(args[1].rstrip("."))
         if not m:
             raise Exception(f"no such module: {args[1]}")
         self.current = m
 
-    def handle_exec(self, args):
+    def handle_refresh(self, args):
+        current = str(self.current) if self.current else None
+        self.session.refresh()
+        self.current = self.session.find_module(current) if current else None
+        self.watched = None
+        if self.completer:
+            self.completer.invalidate()
+
+    def resolve_command(self, args):
         if len(args) < 2:
             raise Exception(f"usage: {args[0]} <command> [args...]")
 
-        name = args[1]
-        args = args[2:]
-        cmd = self.find_command(name)
+        cmd = self.find_command(args[1])
         if not cmd:
-            raise Exception(f"no such command: {name}")
+            raise Exception(f"no such command: {args[1]}")
+        return cmd, args[2:]
 
+    def resolve_attributes(self, args):
+        if len(args) < 2:
+            return self.current.attributes if self.current else []
+
+        attrs = []
+        for arg in args[1:]:
+            a = self.find_attribute(arg)
+            if not a:
+                raise Exception(f"no such attribute: {arg}")
+            attrs.append(a)
+        return attrs
+
+    def handle_exec(self, args):
+        cmd, args = self.resolve_command(args)
         for res in cmd.execute(args):
             print(str(res))
 
     def handle_read(self, args):
-        if not self.current:
+        attrs = self.resolve_attributes(args)
+        for attr, val in zip(attrs, self.session.read_attributes(attrs)):
+            print("{}{:<16}{}{}".format(termcolors.BOLD + termcolors.WHITE,
+                                        attr.name, termcolors.RESET, str(val)))
+
+    def platform(self) -> str:
+        # most platforms share the same top-level module name, so the key
+        # also includes a digest of the module hierarchy and its kinds
+        digest = hashlib.sha1()
+        for m in walk(self.session.modules):
+            digest.update("{} {}\n".format(m.hierarchy_name(),
+                                            m.kind).encode())
+        return "{}:{}".format(",".join(m.name for m in self.session.modules),
+                              digest.hexdigest()[:16])
+
+    def load_watches(self):
+        self.watches = []
+        self.watched = None
+        self.watch_stamp = None
+        self.watch_base = {}
+        self.watch_values = {}
+        try:
+            with open(WATCH_FILE) as f:
+                self.watches = json.load(f).get(self.platform(), [])
+        except (OSError, ValueError):
+            pass
+
+    def save_watches(self):
+        try:
+            with open(WATCH_FILE) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if self.watches:
+            data[self.platform()] = self.watches
+        else:
+            data.pop(self.platform(), None)
+        with open(WATCH_FILE, "w") as f:
+            json.dump(data, f, indent=2)
+
+    def handle_watch(self, args):
+        if len(args) < 2 or args[1] == "list":
+            for name in self.watches:
+                print(name)
             return
 
-        if len(args) < 2:
-            attrs = self.current.attributes
+        if args[1] not in ["add", "del"] or len(args) < 3:
+            raise Exception(f"usage: {args[0]} add|del <attributes...>")
+
+        if args[1] == "add":
+            for attr in self.resolve_attributes(args[1:]):
+                if attr.hierarchy_name() not in self.watches:
+                    self.watches.append(attr.hierarchy_name())
         else:
-            attrs = []
-            for arg in args[1:]:
-                a = self.find_attribute(arg)
-                if not a:
-                    raise Exception(f"no such attribute: {arg}")
-                attrs.append(a)
-
-        for attr in attrs:
-            val = attr.get()
-            print("{}{:<16}{}{}".format(termcolors.BOLD + termcolors.WHITE,
-                                        attr.name, termcolors.RESET, str(val)))
+            names = set()
+            for name in args[2:]:
+                attr = self.find_attribute(name)
+                names.add(attr.hierarchy_name() if attr else name)
+            missing = names - set(self.watches)
+            if missing:
+                raise Exception("not watched: " + ", ".join(sorted(missing)))
+            self.watches = [n for n in self.watches if n not in names]
+
+        self.watched = None
+        self.save_watches()
+
+    def handle_snapshot(self, args):
+        if len(args) != 2:
+            raise Exception(f"usage: {args[0]} <file>")
+
+        snapshot = self.session.snapshot(self.current)
+        snapshot.save(args[1])
+        print(f"saved {len(snapshot)} attributes to {args[1]}")
+
+    def handle_diff(self, args):
+        if len(args) != 3:
+            raise Exception(f"usage: {args[0]} <file> <file>")
+
+        a = Snapshot.load(args[1])
+        b = Snapshot.load(args[2])
+        self.write_lines(iter(vcml.snapshot.report(a, b, a.diff(b))))
 
     def handle_break(self, args):
-        if len(args) < 2:
-            raise Exception(f"usage: {args[0]} <address> [targets]")
+        if len(args) == 1:
+            for bp in self.session.breakpoints:
+                print(f"Breakpoint {bp}")
+            return
+
+        if args[1] in ["-s", "-l"]:
+            if len(args) != 3:
+                raise Exception(f"usage: {args[0]} {args[1]} <file>")
+            if args[1] == "-s":
+                self.session.breakpoints.save(args[2])
+                print(f"Saved {len(self.session.breakpoints)} breakpoints")
+            else:
+                bps = self.session.breakpoints.restore(args[2])
+                print(f"Restored {len(bps)} breakpoints")
+            return
 
         addr = args[1]
         targets = []
         for name in args[2:]:
-            targets.append(self.session.find_target(name))
+            target = self.session.find_target(name)
+            if not target:
+                raise Exception(f"No such target: {name}")
+            targets.append(target)
 
         if len(args) == 2:
             targets = self.session.targets
 
-        for target in targets:
-            id = self.session.create_breakpoint(target, addr)
-            print(f"Created breakpoint {id} on target {target}")
+        for bp in self.session.breakpoints.create(targets, [addr]):
+            print(f"Created breakpoint {bp.id} on target {bp.target}")
 
     def handle_delete(self, args):
         if len(args) < 2:
             raise Exception(f"usage: {args[0]} <id> [id...]")
 
-        for id in args[1:]:
-            print(f"deleting breakpoint {id}")
-            self.session.delete_breakpoint(id)
+        print("deleting breakpoint(s) " + ", ".join(args[1:]))
+        self.session.breakpoints.delete(args[1:])
+
+    def handle_profile(self, args):
+        if len(args) < 2:
+            raise Exception(f"usage: {args[0]} <command> [args...]")
+
+        command, args = self.resolve(args[1:])
+        profiler, self.profiler = self.profiler, Profiler()
+        try:
+            self.invoke(command, args)
+        finally:
+            self.profiler.report(top=15)
+            self.profiler.close()
+            self.profiler = profiler
+
+    def handle_history(self, args):
+        if len(args) > 2:
+            raise Exception(f"usage: {args[0]} [file]")
+
+        if len(args) == 1:
+            self.session.dump_history()
+            return
+
+        with open(args[1], "a") as f:
+            self.session.dump_history(f)
+        print(f"protocol history written to {args[1]}")
+
+    def handle_sigusr1(self, signum, frame):
+        if self.session:
+            self.session.dump_history()
 
     def handle_help(self, args):
         for cmd in self.commands:
@@ -393,6 +1135,48 @@ class Application:
         #                                "todo", termcolors.RESET,
         #                                "add commands for breakpoints, etc."))
 
+def main():
+    parser = argparse.ArgumentParser(
+        description="control VCML based virtual platforms")
+    parser.add_argument("address", nargs="?",
+                        help="session to connect to as [host]:<port>")
+    parser.add_argument("-s", "--script", metavar="FILE",
+                        help="execute commands from FILE ('-' for stdin)")
+    parser.add_argument("-c", "--command", metavar="CMD", action="append",
+                        default=[], help="execute CMD, may be repeated or " +
+                        "contain multiple commands separated by ';'")
+    parser.add_argument("-a", "--attach", action="store_true",
+                        help="attach without stopping the simulation")
+    parser.add_argument("-k", "--keep-going", action="store_true",
+                        help="continue a script after a failing command")
+    parser.add_argument("-p", "--profile", metavar="FILE",
+                        help="write a profile of all commands to FILE on exit")
+    args = parser.parse_args()
+
+    profiler = Profiler() if args.profile else None
+    try:
+        run(args, profiler)
+    finally:
+        if profiler:
+            with open(args.profile, "w") as f:
+                profiler.report(f)
+
+def run(args, profiler):
+    if not args.script and not args.command:
+        app = Application(args.address, args.attach, profiler)
+        app.run()
+        return
+
+    lines = [c for cmd in args.command for c in cmd.split(";")]
+    if args.script == "-":
+        lines += sys.stdin.readlines()
+    elif args.script:
+        with open(args.script) as f:
+            lines += f.readlines()
+
+    app = Application(profiler=profiler)
+    sys.exit(app.run_script(lines, args.address, args.keep_going,
+                            args.attach))
+
 if __name__ == "__main__":
-    app = Application()
-    app.run()
+    main()
@@ -34,3 +34,11 @@ SESSION = YELLOW
 MODULE = BOLD + CYAN
 COMMAND = BOLD + MAGENTA
 ATTRIBUTE = WHITE
+CHANGED = BOLD + YELLOW
+
+
+def disable():
+    for name in ["RESET", "BOLD", "BLACK", "RED", "GREEN", "YELLOW", "BLUE",
+                 "MAGENTA", "CYAN", "WHITE", "HIGHLIGHT", "TIMESTAMP",
+                 "SESSION", "MODULE", "COMMAND", "ATTRIBUTE", "CHANGED"]:
+        globals()[name] = ""
@@ -16,8 +16,14 @@
  #                                                                            #
  ##############################################################################
 
-from .session import Session
+from .session import Session, Status, StopEvent, WatchEvent
 from .module import Module
 from .attribute import Attribute
 from .command import Command
 from .target import Target
+from .trace import Trace
+from .breakpoint import Breakpoint, Breakpoints
+from .trie import Trie
+from .speed import SpeedMeter
+from .snapshot import Snapshot
+from .connection import ProtocolError
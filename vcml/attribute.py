@@ -36,7 +36,14 @@ class Attribute:
     def get(self):
         if self.count == 0:
             return "<empty>"
-        val = self.conn.command("geta," + self.hierarchy_name())
+        return self.decode(self.conn.command(self.request()))
+
+    def request(self) -> str:
+        return "geta," + self.hierarchy_name()
+
+    def decode(self, val):
+        if self.count == 0:
+            return "<empty>"
         if len(val) != self.count:
             raise Exception("unexpected response to a command: " + str(val))
         if self.count == 1:
@@ -0,0 +1,125 @@
+ ##############################################################################
+ #                                                                            #
+ # Copyright 2024 MachineWare GmbH                                            #
+ #                                                                            #
+ # Licensed under the Apache License, Version 2.0 (the "License");            #
+ # you may not use this file except in compliance with the License.           #
+ # You may obtain a copy of the License at                                    #
+ #                                                                            #
+ #     http://www.apache.org/licenses/LICENSE-2.0                             #
+ #                                                                            #
+ # Unless required by applicable law or agreed to in writing, software        #
+ # distributed under the License is distributed on an "AS IS" BASIS,          #
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+ # See the License for the specific language governing permissions and        #
+ # limitations under the License.                                             #
+ #                                                                            #
+ ##############################################################################
+
+import json
+import re
+from typing import List
+
+from .connection import Connection
+
+
+def parse_address(addr) -> int:
+    return addr if isinstance(addr, int) else int(str(addr), 0)
+
+def parse_id(res: List[str]) -> int:
+    match = re.search(r"(\d+)\s*$", res[0]) if len(res) == 1 else None
+    if not match:
+        raise Exception("unexpected response to mkbp command: " + str(res))
+    return int(match.group(1))
+
+class Breakpoint:
+    def __init__(self, id: int, target: str, addr: int):
+        self.id = id
+        self.target = target
+        self.addr = addr
+
+    def __str__(self):
+        return "{} at 0x{:x} on {}".format(self.id, self.addr, self.target)
+
+class Breakpoints:
+    def __init__(self, conn: Connection):
+        self._conn = conn
+        self._ids = {}
+        self._locations = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(list(self._ids.values()))
+
+    def get(self, id) -> Breakpoint:
+        return self._ids.get(int(id))
+
+    def find(self, target, addr) -> Breakpoint:
+        return self._locations.get((str(target), parse_address(addr)))
+
+    def hit(self, reason: str) -> Breakpoint:
+        match = re.search(r"breakpoint\D*(\d+)", reason)
+        return self._ids.get(int(match.group(1))) if match else None
+
+    def on_target(self, target) -> List[Breakpoint]:
+        return [bp for bp in self._ids.values() if bp.target == str(target)]
+
+    def create(self, targets, addrs) -> List[Breakpoint]:
+        locations = []
+        for target in targets:
+            for addr in addrs:
+                locations.append((str(target), parse_address(addr)))
+        return self._create(locations)
+
+    def _create(self, locations) -> List[Breakpoint]:
+        todo = [loc for loc in dict.fromkeys(locations)
+                if loc not in self._locations]
+        cmds = ["mkbp,{},0x{:x}".format(t, a) for t, a in todo]
+        results = self._conn.pipeline(cmds, False) if cmds else []
+
+        errors = []
+        for (target, addr), res in zip(todo, results):
+            try:
+                if isinstance(res, Exception):
+                    raise res
+                bp = Breakpoint(parse_id(res), target, addr)
+                self._ids[bp.id] = bp
+                self._locations[(target, addr)] = bp
+            except Exception as err:
+                errors.append(err)
+
+        if errors:
+            raise errors[0]
+        return [self._locations[loc] for loc in locations]
+
+    def delete(self, bps):
+        ids = [bp.id if isinstance(bp, Breakpoint) else int(bp) for bp in bps]
+        results = self._conn.pipeline([f"rmbp,{id}" for id in ids], False)
+
+        errors = []
+        for id, res in zip(ids, results):
+            if isinstance(res, Exception):
+                errors.append(res)
+                continue
+            bp = self._ids.pop(id, None)
+            if bp:
+                self._locations.pop((bp.target, bp.addr), None)
+
+        if errors:
+            raise errors[0]
+
+    def clear(self):
+        self.delete(list(self._ids))
+
+    def save(self, path: str):
+        bps = [{"target": bp.target, "address": bp.addr} for bp in self]
+        with open(path, "w") as f:
+            json.dump(bps, f, indent=2)
+
+    def restore(self, path: str) -> List[Breakpoint]:
+        with open(path) as f:
+            bps = json.load(f)
+        return self._create([(bp["target"], parse_address(bp["address"]))
+                             for bp in bps])
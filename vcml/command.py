@@ -41,6 +41,9 @@ class Command:
         self.parent = None
 
     def execute(self, args: List[str]):
+        return self.conn.command(self.request(args))
+
+    def request(self, args: List[str]) -> str:
         if len(args) < self.argc:
             raise Exception("need {} argument(s) for {}, have {}".format(
                 self.argc, self.name, len(args)))
@@ -48,5 +51,4 @@ class Command:
         cmd = "exec," + self.parent.hierarchy_name() + "," + self.name
         if args:
             cmd = cmd + "," + ",".join(args)
-
-        return self.conn.command(cmd)
+        return cmd
@@ -16,9 +16,29 @@
  #                                                                            #
  ##############################################################################
 
+import collections
 import socket
+import sys
+import threading
+import time
 from typing import List
 
+RECONNECT_RETRIES = 5 # number of attempts to restore a broken connection
+RECONNECT_DELAY = 0.1 # initial delay between reconnection attempts
+PIPELINE_DEPTH = 64 # maximum number of commands in flight
+HISTORY_SIZE = 256 # number of packets kept in the flight recorder
+HISTORY_PAYLOAD = 80 # payload characters kept per recorded packet
+
+Packet = collections.namedtuple("Packet", "timestamp direction payload valid")
+
+
+class ProtocolError(Exception):
+    pass
+
+# Commands that do not alter the simulation state and are therefore safe to
+# send again after the connection broke down while waiting for a response.
+READ_ONLY = ["version", "list", "getq", "status", "geta"]
+
 
 def checksum(s: str) -> int:
     sum = 0
@@ -54,11 +74,30 @@ def decompose(s: str) -> List[str]:
     l.append(b)
     return l
 
+def read_only(cmd: str) -> bool:
+    return cmd.split(",", 1)[0] in READ_ONLY
+
+def parse(raw: str) -> List[str]:
+    v = decompose(raw)
+
+    if len(v) == 0:
+        raise ProtocolError("failed to parse response: '" + raw + "'")
+    if v[0] != "OK":
+        raise Exception(", ".join(v[1:]))
+    return v[1:]
+
 class Connection:
-    def __init__(self, address: str):
+    def __init__(self, address: str, history: int = HISTORY_SIZE,
+                 retries: int = RECONNECT_RETRIES):
         self.host: str = ""
         self.port: int = 0
         self.socket = None
+        self.history = collections.deque(maxlen=history)
+        self.retries = retries
+        self.remote = None
+        self.on_reconnect = None
+        self.lock = threading.RLock()
+        self.delivered = False
 
         addr = address.rsplit(":", 1)
         if len(addr) != 2:
@@ -88,6 +127,7 @@ class Connection:
                 self.socket.connect(addr)
                 self.host = str(host)
                 self.port = int(port)
+                self.remote = (self.host, self.port)
                 return
             except OSError as e:
                  continue
@@ -100,20 +140,76 @@ class Connection:
 
         self.host = ""
         self.port = 0
-        self.socket.shutdown(socket.SHUT_RDWR)
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.socket.close()
 
+    def reconnect(self):
+        delay = RECONNECT_DELAY
+        for attempt in range(self.retries):
+            self.record("---", "reconnecting, attempt {}".format(attempt + 1))
+            try:
+                self.connect(*self.remote)
+            except OSError:
+                time.sleep(delay)
+                delay = delay * 2
+                continue
+
+            if self.on_reconnect:
+                self.on_reconnect()
+            return
+
+        self.disconnect()
+        raise ConnectionError("failed to reconnect to {}:{}".format(
+            *self.remote))
+
+    def resync(self):
+        # responses still in flight would otherwise be taken for the
+        # responses to the commands that follow
+        if not self.connected():
+            return
+        if self.retries and self.remote:
+            self.reconnect()
+        else:
+            self.disconnect()
+
     def peer(self) -> str:
         if not self.connected():
             return "not connected"
         return self.host + ":" + str(self.port)
 
+    def record(self, direction: str, payload: str, valid=None):
+        self.history.append(Packet(time.time(), direction,
+                                   payload[:HISTORY_PAYLOAD], valid))
+
+    def dump_history(self, f=sys.stderr):
+        f.write("flight recorder: last {} packet(s) on {}\n".format(
+            len(self.history), self.peer()))
+        for pkt in list(self.history):
+            valid = "" if pkt.valid is None else "ok" if pkt.valid else "bad"
+            f.write("{:.6f} {:<3} {:<3} {}\n".format(pkt.timestamp,
+                    pkt.direction, valid, pkt.payload.replace("\n", "\\n")))
+        f.flush()
+
     def signal(self, sig: str):
         if not self.connected():
             raise Exception("not connected")
         if len(sig) > 1:
             raise Exception("invalid signal: " + sig)
-        self.socket.send(sig.encode())
+        with self.lock:
+            self.record("sig", sig)
+            self.socket.send(sig.encode())
+
+    def read(self, n: int) -> str:
+        data = b""
+        while len(data) < n:
+            buf = self.socket.recv(n - len(data))
+            if not buf:
+                raise ConnectionResetError("connection closed by peer")
+            data += buf
+        return data.decode()
 
     def send(self, data: str):
         if not self.connected():
@@ -121,17 +217,21 @@ class Connection:
 
         data = escape(data)
 
-        for _ in range(5):
-            chk = "{0:02x}".format(checksum(data))
-            pkt = "$" + data + "#" + chk
-            self.socket.send(pkt.encode())
-            resp = self.socket.recv(1).decode()
-            if resp == '+':
-                return
+        with self.lock:
+            for _ in range(5):
+                chk = "{0:02x}".format(checksum(data))
+                pkt = "$" + data + "#" + chk
+                self.record("tx", data)
+                self.delivered = True
+                self.socket.send(pkt.encode())
+                resp = self.read(1)
+                if resp == '+':
+                    return
+                self.record("rx", resp, False)
 
-        raise Exception("failed to send command: " + data)
+        raise ProtocolError("failed to send command: " + data)
 
-    def recv(self) -> str:
+    def recv(self, ack: bool = True) -> str:
         packet = ""
         chksum = 0
         repeat = 5 # number of attempts to receive a valid response paket
@@ -141,7 +241,7 @@ class Connection:
             if not self.connected():
                 raise Exception("not connected")
 
-            r = self.socket.recv(1).decode()
+            r = self.read(1)
             if r == "$":
                 packet = ""
                 chksum = 0
@@ -149,18 +249,23 @@ class Connection:
 
             if r == '#':
                 chksum = chksum % 256
-                refsum = int(self.socket.recv(2).decode(), 16)
+                refsum = int(self.read(2), 16)
                 if chksum == refsum:
-                    self.socket.send("+".encode())
+                    self.record("rx", packet, True)
+                    if ack:
+                        self.socket.send("+".encode())
                     return packet
+                self.record("rx", packet, False)
+                if not ack:
+                    raise ProtocolError("failed to receive response")
                 self.socket.send("-".encode())
                 repeat = repeat - 1
                 if repeat == 0:
-                    raise Exception("failed to receive response")
+                    raise ProtocolError("failed to receive response")
 
             if r == "}":
                 chksum += ord(r)
-                r = self.socket.recv(1).decode()
+                r = self.read(1)
                 chksum += ord(r)
                 packet += str(ord(r) ^ 0x20)
             else:
@@ -168,15 +273,85 @@ class Connection:
                 packet += str(r)
 
             if len(packet) > maxlen:
-                raise Exception("response length exceeds limit")
+                raise ProtocolError("response length exceeds limit")
 
-    def command(self, cmd):
+    def transact(self, cmd):
         self.send(cmd)
-        raw = self.recv()
-        v = decompose(raw)
-
-        if len(v) == 0:
-            raise Exception("failed to parse response: '" + raw + "'")
-        if v[0] != "OK":
-            raise Exception(", ".join(v[1:]))
-        return v[1:]
+        return parse(self.recv())
+
+    def retry(self, func, cmds: List[str]):
+        with self.lock:
+            self.delivered = False
+            try:
+                return func()
+            except OSError as err:
+                if not self.retries or not self.remote:
+                    raise
+                # Commands that may have reached the simulation are only
+                # sent again if they have no side effects. A timeout means
+                # that the simulation is still busy with them, so nothing
+                # is sent again, but the stale response must be discarded.
+                replay = not self.delivered or \
+                    (not isinstance(err, TimeoutError) and
+                     all(read_only(cmd) for cmd in cmds))
+                self.reconnect()
+                if not replay:
+                    raise ProtocolError("connection restored after '{}', "
+                        "command may not have been executed".format(err)) \
+                        from err
+                return func()
+
+    def command(self, cmd):
+        return self.retry(lambda: self.transact(cmd), [cmd])
+
+    def pipeline(self, cmds: List[str], strict: bool = True) -> List:
+        return self.retry(lambda: self.transact_many(cmds, strict), cmds)
+
+    def transact_many(self, cmds: List[str], strict: bool = True) -> List:
+        if not self.connected():
+            raise Exception("not connected")
+
+        try:
+            results = self._exchange(cmds)
+        except OSError:
+            raise
+        except Exception:
+            self.resync()
+            raise
+
+        if strict:
+            for res in results:
+                if isinstance(res, Exception):
+                    raise res
+        return results
+
+    def _exchange(self, cmds: List[str]) -> List:
+        # Every packet after the first is preceded by the acknowledgement
+        # for the response to its predecessor, so that the server can keep
+        # on sending responses while further commands are still in flight.
+        results = []
+        sent = 0
+        while len(results) < len(cmds):
+            pkts = []
+            while sent < len(cmds) and sent - len(results) < PIPELINE_DEPTH:
+                data = escape(cmds[sent])
+                self.record("tx", data)
+                pkts.append("+" if sent else "")
+                pkts.append("$" + data + "#{0:02x}".format(checksum(data)))
+                sent += 1
+            if pkts:
+                self.delivered = True
+                self.socket.sendall("".join(pkts).encode())
+
+            resp = self.read(1)
+            if resp != "+":
+                self.record("rx", resp, False)
+                raise ProtocolError("failed to send command: " +
+                                cmds[len(results)])
+
+            raw = self.recv(len(results) == len(cmds) - 1)
+            try:
+                results.append(parse(raw))
+            except Exception as err:
+                results.append(err)
+        return results
@@ -16,11 +16,42 @@
  #                                                                            #
  ##############################################################################
 
+import fnmatch
+import sys
 import xml.etree.ElementTree as ElementTree
+from typing import List
 
 from .attribute import Attribute
 from .command import Command
 
+CHUNK = 256 # number of lines written to the output at once
+
+
+def walk(modules: List, depth: int = None, kinds: List[str] = None,
+         name: str = None):
+    stack = [(m, 0) for m in reversed(modules)]
+    while stack:
+        m, level = stack.pop()
+        if (not kinds or m.kind in kinds) and \
+           (not name or fnmatch.fnmatchcase(m.name, name)):
+            yield m
+        if depth is None or level < depth:
+            stack.extend((sub, level + 1) for sub in reversed(m.modules))
+
+def dump(modules: List, f=None, depth: int = None):
+    f = f or sys.stdout
+    lines = []
+    for m in walk(modules, depth):
+        lines.append(m.hierarchy_name() + " (" + m.kind + ")")
+        for a in m.attributes:
+            lines.append("  " + a.name + ": " + a.type)
+        if len(lines) >= CHUNK:
+            f.write("\n".join(lines) + "\n")
+            lines.clear()
+    if lines:
+        f.write("\n".join(lines) + "\n")
+    f.flush()
+
 
 class Module:
     def __init__(self, conn, parent, xmlnode):
@@ -96,9 +127,9 @@ class Module:
         m = self.find_module(path[:-1])
         return m.find_command(path[-1:]) if m else None
 
-    def dump(self):
-        print(self.hierarchy_name() + " (" + self.kind + ")")
-        for a in self.attributes:
-            print("  " + a.name + ": " + a.type)
-        for m in self.modules:
-            m.dump()
+    def walk(self, depth: int = None, kinds: List[str] = None,
+             name: str = None):
+        return walk([self], depth, kinds, name)
+
+    def dump(self, f=None, depth: int = None):
+        dump([self], f, depth)
@@ -0,0 +1,95 @@
+ ##############################################################################
+ #                                                                            #
+ # Copyright 2024 MachineWare GmbH                                            #
+ #                                                                            #
+ # Licensed under the Apache License, Version 2.0 (the "License");            #
+ # you may not use this file except in compliance with the License.           #
+ # You may obtain a copy of the License at                                    #
+ #                                                                            #
+ #     http://www.apache.org/licenses/LICENSE-2.0                             #
+ #                                                                            #
+ # Unless required by applicable law or agreed to in writing, software        #
+ # distributed under the License is distributed on an "AS IS" BASIS,          #
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+ # See the License for the specific language governing permissions and        #
+ # limitations under the License.                                             #
+ #                                                                            #
+ ##############################################################################
+
+import contextlib
+import cProfile
+import pstats
+import sys
+import time
+import tracemalloc
+
+TOP = 25 # number of functions listed in a report
+
+
+class Section:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.alloc = 0
+        self.peak = 0
+
+class Profiler:
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.profile = cProfile.Profile()
+        self.sections = {}
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def section(self, name: str):
+        if self._depth:
+            yield
+            return
+
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            mem = tracemalloc.get_traced_memory()[0]
+
+        self._depth += 1
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self.profile.enable()
+        try:
+            yield
+        finally:
+            self.profile.disable()
+            s = self.sections.setdefault(name, Section(name))
+            s.calls += 1
+            s.wall += time.perf_counter() - wall
+            s.cpu += time.process_time() - cpu
+            if self.memory:
+                curr, peak = tracemalloc.get_traced_memory()
+                s.alloc += curr - mem
+                s.peak = max(s.peak, peak - mem)
+            self._depth -= 1
+
+    def report(self, f=None, top: int = TOP):
+        f = f or sys.stdout
+        f.write("{:<20} {:>8} {:>10} {:>10} {:>12} {:>12}\n".format(
+            "section", "calls", "wall (s)", "cpu (s)", "alloc (KiB)",
+            "peak (KiB)"))
+        for s in sorted(self.sections.values(), key=lambda s: -s.wall):
+            f.write("{:<20} {:>8} {:>10.4f} {:>10.4f} {:>12.1f} {:>12.1f}\n"
+                    .format(s.name, s.calls, s.wall, s.cpu, s.alloc / 1024,
+                            s.peak / 1024))
+
+        if not self.sections:
+            return
+
+        f.write("\n")
+        stats = pstats.Stats(self.profile, stream=f)
+        stats.sort_stats("cumulative").print_stats(r"vcml|pyvp", top)
+        f.flush()
+
+    def close(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
@@ -0,0 +1,183 @@
+ ##############################################################################
+ #                                                                            #
+ # Copyright 2024 MachineWare GmbH                                            #
+ #                                                                            #
+ # Licensed under the Apache License, Version 2.0 (the "License");            #
+ # you may not use this file except in compliance with the License.           #
+ # You may obtain a copy of the License at                                    #
+ #                                                                            #
+ #     http://www.apache.org/licenses/LICENSE-2.0                             #
+ #                                                                            #
+ # Unless required by applicable law or agreed to in writing, software        #
+ # distributed under the License is distributed on an "AS IS" BASIS,          #
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+ # See the License for the specific language governing permissions and        #
+ # limitations under the License.                                             #
+ #                                                                            #
+ ##############################################################################
+
+import argparse
+import socket
+import socketserver
+import threading
+import time
+
+from .connection import Connection, checksum, read_only
+
+FRESHNESS = 0.05 # seconds a cached status response remains valid
+
+# Responses to these commands are shared between all clients. The status is
+# only reused within the freshness window, the others until they change. Any
+# command that is not read-only invalidates the cached status, so that all
+# clients observe its effect.
+CACHED = ["version", "list,xml", "getq", "status"]
+
+
+def frame(data: str) -> bytes:
+    esc = ""
+    for c in data:
+        if c in "$#*}":
+            esc += "}" + chr(ord(c) ^ 0x20)
+        else:
+            esc += c
+    return "${}#{:02x}".format(esc, checksum(esc)).encode()
+
+def unescape(data: str) -> str:
+    r = ""
+    i = 0
+    while i < len(data):
+        if data[i] == "}" and i < len(data) - 1:
+            r += chr(ord(data[i + 1]) ^ 0x20)
+            i += 2
+        else:
+            r += data[i]
+            i += 1
+    return r
+
+class ProxyHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        last = b""
+        while True:
+            c = self.rfile.read(1)
+            if not c:
+                return
+
+            if c == b"+":
+                continue
+
+            if c == b"-":
+                self.wfile.write(last)
+                continue
+
+            if c != b"$":
+                self.server.signal(c.decode())
+                continue
+
+            data = b""
+            while True:
+                c = self.rfile.read(1)
+                if not c:
+                    return
+                if c == b"#":
+                    break
+                data += c
+
+            chk = self.rfile.read(2)
+            if int(chk or b"0", 16) != checksum(data.decode()):
+                self.wfile.write(b"-")
+                continue
+
+            self.wfile.write(b"+")
+            cmd = unescape(data.decode())
+            if cmd == "quit":
+                self.server.quit()
+                return
+
+            try:
+                last = frame(self.server.request(cmd))
+            except Exception as err:
+                last = frame("E," + str(err).replace(",", "\\,"))
+            self.wfile.write(last)
+
+class Proxy(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, upstream: str, port: int, host: str = "localhost",
+                 freshness: float = FRESHNESS):
+        self.upstream = Connection(upstream)
+        self.upstream.on_reconnect = self.invalidate
+        self.freshness = freshness
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        super().__init__((host, port), ProxyHandler)
+
+    def invalidate(self, cmds=CACHED):
+        for cmd in cmds:
+            self.cache.pop(cmd, None)
+
+    def request(self, cmd: str) -> str:
+        with self.lock:
+            now = time.monotonic()
+            hit = self.cache.get(cmd)
+            if hit and (cmd != "status" or now - hit[0] < self.freshness):
+                self.hits += 1
+                return hit[1]
+
+            self.misses += 1
+            if not read_only(cmd):
+                self.invalidate(["status", "getq"] if cmd.startswith("setq")
+                                else ["status"])
+            raw = self.upstream.retry(lambda: self.forward(cmd), [cmd])
+            if cmd in CACHED and raw.startswith("OK"):
+                self.cache[cmd] = (now, raw)
+            return raw
+
+    def forward(self, cmd: str) -> str:
+        try:
+            self.upstream.send(cmd)
+            return self.upstream.recv()
+        except OSError:
+            raise
+        except Exception:
+            self.upstream.resync()
+            raise
+
+    def signal(self, sig: str):
+        with self.lock:
+            self.invalidate(["status"])
+            self.upstream.retry(lambda: self.upstream.signal(sig), [])
+
+    def quit(self):
+        with self.lock:
+            self.invalidate()
+            self.upstream.retry(lambda: self.upstream.send("quit"), ["quit"])
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="share one VCML session between multiple clients")
+    parser.add_argument("upstream", help="session to proxy as [host]:<port>")
+    parser.add_argument("-p", "--port", type=int, required=True,
+                        help="port to accept client connections on")
+    parser.add_argument("--host", default="localhost",
+                        help="interface to accept client connections on")
+    parser.add_argument("-f", "--freshness", type=float, default=FRESHNESS,
+                        help="seconds a cached status remains valid")
+    args = parser.parse_args()
+
+    proxy = Proxy(args.upstream, args.port, args.host, args.freshness)
+    print("proxying {} on {}:{}".format(proxy.upstream.peer(), args.host,
+                                        args.port))
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.server_close()
+        print("{} cached, {} forwarded".format(proxy.hits, proxy.misses))
+
+if __name__ == "__main__":
+    main()
@@ -17,38 +17,62 @@
  ##############################################################################
 
 from operator import truediv
+import sys
 import time
 import threading
 import xml.etree.ElementTree as ElementTree
-from typing import List
+from collections import namedtuple
+from typing import Callable, Dict, List
 
 from .connection import Connection
 from .attribute import Attribute
-from .module import Module
+from .breakpoint import Breakpoints
+from .module import Module, walk, dump
+from .snapshot import Snapshot
+from .speed import SpeedMeter
 from .target import Target
+from .trace import Trace
+
+POLL_MIN = 0.001 # initial status polling interval in seconds
+POLL_MAX = 0.1 # maximum status polling interval in seconds
+
+def decode_attributes(attrs: List[Attribute], res: List) -> List:
+    it = iter(res)
+    return [a.decode(next(it) if a.count else []) for a in attrs]
+
+Status = namedtuple("Status", "running reason time cycle")
+StopEvent = namedtuple("StopEvent", "reason breakpoint target address time cycle")
+WatchEvent = namedtuple("WatchEvent", "start time cycle values")
 
 
 class Session:
-    def __init__(self, address: str):
+    def __init__(self, address: str, stop: bool = True):
         self._version: List[str] = ["unknown", "unknown"]
         self._running: bool = False
         self._reason: str = ""
         self._time: int = 0
         self._cycle: int = 0
         self._quantum: int = 0
+        self._poll: float = POLL_MIN
+        self._listeners: List[Callable] = []
         self._conn = None
 
         self._conn = Connection(address)
         self.modules = []
         self.targets = []
+        self.breakpoints = Breakpoints(self._conn)
+        self.meter = SpeedMeter()
 
-        self._conn.command("stop")
+        if stop:
+            self._conn.command("stop")
 
         self.update_version()
         self.update_quantum()
         self.update_status()
         self.update_modules()
 
+        self._conn.on_reconnect = self.resume_session
+
     def __del__(self):
         try:
             if self._conn:
@@ -70,6 +94,14 @@ class Session:
 
         self._version = res
 
+    def resume_session(self):
+        res = self._conn.transact("version")
+        if res != self._version:
+            self._conn.disconnect()
+            raise ConnectionError("cannot resume session, simulation " +
+                                  "version changed to " + ", ".join(res))
+        self.parse_status(self._conn.transact("status"))
+
     def update_quantum(self):
         res = self._conn.command("getq")
         if len(res) != 1:
@@ -77,8 +109,17 @@ class Session:
 
         self._quantum = int(res[0])
 
+    def set_quantum(self, quantum: int):
+        self._conn.command(f"setq,{quantum}ns")
+        self.update_quantum()
+
+    def quantum(self) -> int:
+        return self._quantum
+
     def update_status(self):
-        res = self._conn.command("status")
+        self.parse_status(self._conn.command("status"))
+
+    def parse_status(self, res: List[str]):
         if len(res) != 3:
             raise Exception("unexpected response to status command: " + str(res))
 
@@ -91,6 +132,7 @@ class Session:
             self._reason = status[8:]
         self._time = int(res[1])
         self._cycle = int(res[2])
+        self.meter.update(self._running, self._time, self._cycle)
 
     def update_modules(self):
         res = self._conn.command("list,xml")
@@ -102,12 +144,23 @@ class Session:
             raise Exception("invalid hierarchy root node: " + root.tag)
 
         self.modules.clear()
+        self.targets.clear()
         for subnode in root:
             if subnode.tag == "object":
                 self.modules.append(Module(self._conn, None, subnode))
             elif subnode.tag == "target":
                 self.targets.append(Target(self._conn, subnode))
 
+    def status(self, update: bool = True) -> Status:
+        if update:
+            self.update_status()
+        return Status(self._running, self._reason, self._time, self._cycle)
+
+    def refresh(self):
+        for m in self.modules:
+            m.disconnect()
+        self.update_modules()
+
     def running(self) -> bool:
         self.update_status()
         return self._running
@@ -135,17 +188,64 @@ class Session:
             m.disconnect()
         self._conn.disconnect()
 
-    def kill(self):
-        self._conn.send("quit")
+    def read_attributes(self, attrs: List[Attribute]) -> List:
+        res = self._conn.pipeline([a.request() for a in attrs if a.count])
+        return decode_attributes(attrs, res)
 
-    def step(self):
+    def pipeline(self, cmds: List[str], strict: bool = True) -> List:
+        return self._conn.pipeline(cmds, strict)
+
+    def snapshot(self, module=None) -> Snapshot:
+        modules = self.modules
+        if module is not None:
+            modules = [module if isinstance(module, Module)
+                       else self.find_module(module)]
+            if not modules[0]:
+                raise Exception(f"no such module: {module}")
+
+        attrs = [a for m in walk(modules) for a in m.attributes]
         self.update_status()
-        if not self._running:
-            self._running = True
-            self._conn.command(f"resume,{self._quantum}ns")
+        return Snapshot(self._time, self._cycle,
+                        [a.hierarchy_name() for a in attrs],
+                        self.read_attributes(attrs))
 
-        while self._running:
-            self.update_status()
+    def dump_history(self, f=sys.stderr):
+        self._conn.dump_history(f)
+
+    def kill(self):
+        self._conn.send("quit")
+
+    def step(self, n: int = 1, capture: List = None) -> Trace:
+        attrs = []
+        for a in capture or []:
+            attr = a if isinstance(a, Attribute) else self.find_attribute(a)
+            if not attr:
+                raise Exception(f"no such attribute: {a}")
+            attrs.append(attr)
+
+        self.wait()
+
+        # Reading back the state of one quantum, resuming the next one and
+        # polling its status is done with a single pipelined exchange. Only
+        # quanta that have not completed by then cost further status polls.
+        trace = Trace([a.hierarchy_name() for a in attrs])
+        reads = [a.request() for a in attrs if a.count]
+        for i in range(n + 1):
+            cmds = reads if i else []
+            if i < n:
+                cmds = cmds + [f"resume,{self._quantum}ns", "status"]
+            res = self._conn.pipeline(cmds) if cmds else []
+
+            if i:
+                trace.append(self._time, self._cycle,
+                             decode_attributes(attrs, res))
+
+            if i < n:
+                self.parse_status(res[-1])
+                if self._running:
+                    self._poll = POLL_MIN
+                    self.wait()
+        return trace
 
     def stepi(self, target):
         self.update_status()
@@ -156,11 +256,163 @@ class Session:
         while self._running:
             self.update_status()
 
-    def run(self):
+    def stepi_many(self, targets, n: int = 1,
+                   capture: List[str] = None) -> Dict[str, Trace]:
+        capture = capture or []
+        found = []
+        for t in targets:
+            target = self.find_target(t)
+            if not target:
+                raise Exception(f"no such target: {t}")
+            found.append(target)
+
+        attrs = []
+        for target in found:
+            for name in capture:
+                attr = self.find_attribute(f"{target}.{name}")
+                if not attr:
+                    raise Exception(f"no such attribute: {target}.{name}")
+                attrs.append(attr)
+
+        self.update_status()
+        if self._running:
+            raise Exception("cannot step while simulation is running")
+
+        # The state captured after each round of steps is read back in the
+        # same exchange that issues the first step of the next round.
+        traces = {target.name: Trace(capture) for target in found}
+        reads = [a.request() for a in attrs if a.count]
+        stamp = None
+        for i in range(n + 1):
+            for target in found if i < n else [None]:
+                cmds = reads if stamp else []
+                if target:
+                    cmds = cmds + [f"step,{target}", "status"]
+                res = self._conn.pipeline(cmds) if cmds else []
+
+                if stamp:
+                    vals = decode_attributes(attrs, res)
+                    for j, target_name in enumerate(traces):
+                        values = vals[j * len(capture):(j + 1) * len(capture)]
+                        traces[target_name].append(*stamp, values)
+                    stamp = None
+
+                if target:
+                    self.parse_status(res[-1])
+                    if self._running:
+                        self._poll = POLL_MIN
+                        self.wait()
+            stamp = (self._time, self._cycle)
+
+        return traces
+
+    def run_until(self, predicate: Callable[[Dict], bool], attrs: List,
+                  resolution: int = None, slice: int = None,
+                  limit: int = None,
+                  distance: Callable[[Dict], float] = None) -> WatchEvent:
+        found = []
+        for a in attrs:
+            attr = a if isinstance(a, Attribute) else self.find_attribute(a)
+            if not attr:
+                raise Exception(f"no such attribute: {a}")
+            found.append(attr)
+
+        names = [a.hierarchy_name() for a in found]
+        reads = [a.request() for a in found if a.count]
+        resolution = resolution or self._quantum or 1
+        slice = max(slice or resolution * 1024, resolution)
+
+        self.wait()
+
+        values = dict(zip(names, self.read_attributes(found)))
+        if predicate(values):
+            return WatchEvent(self._time, self._time, self._cycle, values)
+
+        # The simulation cannot be rewound, so the event is only located
+        # within the slice in which the predicate first holds. Slices double
+        # while the predicate does not hold, reaching a distant event in a
+        # logarithmic number of slices. Without a distance, the precision is
+        # the maximum slice length. The optional distance tells how far the
+        # values are from meeting the predicate: while it decreases, each
+        # slice only runs half of the extrapolated time to the event, so the
+        # slices shrink back to the resolution as the event approaches.
+        end = self._time + limit if limit else None
+        step = resolution
+        last = None
+        while end is None or self._time < end:
+            start = self._time
+            if end is not None:
+                step = min(step, end - start)
+
+            res = self._conn.pipeline([f"resume,{step}ns", "status"])
+            self.parse_status(res[1])
+            if self._running:
+                self._poll = POLL_MIN
+                self.wait()
+
+            values = dict(zip(names, self.read_attributes(found)))
+            if predicate(values):
+                return WatchEvent(start, self._time, self._cycle, values)
+
+            step = min(step * 2, slice)
+            d = distance(values) if distance else None
+            if d is not None and last and d < last[1]:
+                eta = d * (self._time - last[0]) / (last[1] - d)
+                step = min(step, max(int(eta / 2), resolution))
+            last = (self._time, d) if d is not None else None
+
+        return None
+
+    def run(self, duration: int = None):
         self.update_status()
         if not self._running:
             self._running = True
-            self._conn.command("resume")
+            self._poll = POLL_MIN
+            if duration is None:
+                self._conn.command("resume")
+            else:
+                self._conn.command(f"resume,{duration}ns")
+
+    def wait(self, timeout: float = None, interval: float = POLL_MAX) -> bool:
+        # A simulation that is already known to be running is not polled
+        # right away, so that a status received along with a resume is not
+        # requested again immediately.
+        start = time.monotonic()
+        if not self._running and not self.running():
+            return True
+        while True:
+            remaining = interval
+            if timeout is not None:
+                remaining = start + timeout - time.monotonic()
+                if remaining <= 0:
+                    return False
+            time.sleep(min(self._poll, interval, remaining))
+            self._poll = min(self._poll * 2, interval)
+            if not self.running():
+                return True
+
+    def stop_event(self) -> StopEvent:
+        bp = self.breakpoints.hit(self._reason)
+        return StopEvent(self._reason, bp, bp.target if bp else None,
+                         bp.addr if bp else None, self._time, self._cycle)
+
+    def listen(self, callback: Callable[[StopEvent], bool]):
+        self._listeners.append(callback)
+
+    def unlisten(self, callback: Callable[[StopEvent], bool]):
+        self._listeners.remove(callback)
+
+    def events(self):
+        while True:
+            self.run()
+            self.wait()
+            event = self.stop_event()
+            resume = False
+            for callback in list(self._listeners):
+                if callback(event):
+                    resume = True
+            if not resume:
+                yield event
 
     def stop(self):
         self.update_status()
@@ -168,15 +420,17 @@ class Session:
             self._conn.command("stop")
 
     def create_breakpoint(self, target, addr) -> int:
-        res = self._conn.command(f"mkbp,{target},{addr}")
-        return int(res[0][20:])
+        return self.breakpoints.create([target], [addr])[0].id
 
     def delete_breakpoint(self, id):
-        self._conn.command(f"rmbp,{id}")
+        self.breakpoints.delete([id])
 
-    def dump(self):
-        for m in self.modules:
-            m.dump()
+    def walk(self, depth: int = None, kinds: List[str] = None,
+             name: str = None):
+        return walk(self.modules, depth, kinds, name)
+
+    def dump(self, f=None, depth: int = None):
+        dump(self.modules, f, depth)
 
     def find_module(self, name):
         path = name if isinstance(name, list) else name.split(".")
@@ -204,6 +458,8 @@ class Session:
         return m.find_command(path[-1:]) if m else None
 
     def find_target(self, name):
+        if isinstance(name, Target):
+            return name
         for t in self.targets:
             if t.name == str(name):
                 return t
@@ -0,0 +1,91 @@
+ ##############################################################################
+ #                                                                            #
+ # Copyright 2024 MachineWare GmbH                                            #
+ #                                                                            #
+ # Licensed under the Apache License, Version 2.0 (the "License");            #
+ # you may not use this file except in compliance with the License.           #
+ # You may obtain a copy of the License at                                    #
+ #                                                                            #
+ #     http://www.apache.org/licenses/LICENSE-2.0                             #
+ #                                                                            #
+ # Unless required by applicable law or agreed to in writing, software        #
+ # distributed under the License is distributed on an "AS IS" BASIS,          #
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+ # See the License for the specific language governing permissions and        #
+ # limitations under the License.                                             #
+ #                                                                            #
+ ##############################################################################
+
+import gzip
+import itertools
+import json
+import operator
+from collections import namedtuple
+from typing import List
+
+FORMAT = 1 # version of the snapshot file format
+
+Change = namedtuple("Change", "path old new")
+
+
+class Snapshot:
+    def __init__(self, time: int, cycle: int, paths: List[str],
+                 values: List):
+        if len(paths) != len(values):
+            raise Exception("snapshot needs one value per attribute")
+
+        self.time = time
+        self.cycle = cycle
+        self.paths = paths
+        self.values = values
+
+    def __len__(self):
+        return len(self.paths)
+
+    def save(self, path: str):
+        data = json.dumps({"format": FORMAT, "time": self.time,
+                           "cycle": self.cycle, "paths": self.paths,
+                           "values": self.values}, separators=(",", ":"))
+        with gzip.open(path, "wb", compresslevel=1) as f:
+            f.write(data.encode())
+
+    @staticmethod
+    def load(path: str):
+        with gzip.open(path, "rt") as f:
+            data = json.load(f)
+        if data.get("format") != FORMAT:
+            raise Exception(f"unsupported snapshot format in {path}")
+        return Snapshot(data["time"], data["cycle"], data["paths"],
+                        data["values"])
+
+    def diff(self, other) -> List[Change]:
+        # snapshots of the same platform share the same attribute columns,
+        # so a single elementwise comparison finds all changed values
+        if self.paths == other.paths:
+            changed = itertools.compress(range(len(self)),
+                map(operator.ne, self.values, other.values))
+            return [Change(self.paths[i], self.values[i], other.values[i])
+                    for i in changed]
+
+        index = dict(zip(other.paths, range(len(other))))
+        changes = []
+        for path, val in zip(self.paths, self.values):
+            i = index.pop(path, None)
+            if i is None:
+                changes.append(Change(path, val, None))
+            elif other.values[i] != val:
+                changes.append(Change(path, val, other.values[i]))
+        for path, i in sorted(index.items(), key=lambda x: x[1]):
+            changes.append(Change(path, None, other.values[i]))
+        return changes
+
+def report(a: Snapshot, b: Snapshot, changes: List[Change]) -> List[str]:
+    lines = ["comparing {:.9f}s ({} cycles) to {:.9f}s ({} cycles)".format(
+        a.time / 1e9, a.cycle, b.time / 1e9, b.cycle)]
+    for c in changes:
+        lines.append("{}: {} -> {}".format(c.path,
+            "<missing>" if c.old is None else c.old,
+            "<missing>" if c.new is None else c.new))
+    lines.append("{} of {} attributes differ".format(len(changes),
+                                                     max(len(a), len(b))))
+    return lines
@@ -0,0 +1,90 @@
+ ##############################################################################
+ #                                                                            #
+ # Copyright 2024 MachineWare GmbH                                            #
+ #                                                                            #
+ # Licensed under the Apache License, Version 2.0 (the "License");            #
+ # you may not use this file except in compliance with the License.           #
+ # You may obtain a copy of the License at                                    #
+ #                                                                            #
+ #     http://www.apache.org/licenses/LICENSE-2.0                             #
+ #                                                                            #
+ # Unless required by applicable law or agreed to in writing, software        #
+ # distributed under the License is distributed on an "AS IS" BASIS,          #
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+ # See the License for the specific language governing permissions and        #
+ # limitations under the License.                                             #
+ #                                                                            #
+ ##############################################################################
+
+import json
+import time
+
+SMOOTHING = 0.3 # weight of the newest sample in the moving average
+MIN_INTERVAL = 0.05 # minimum wall time in seconds between two samples
+
+
+class SpeedMeter:
+    def __init__(self, smoothing: float = SMOOTHING):
+        self.smoothing = smoothing
+        self.speed = 0.0 # simulated seconds per wall clock second
+        self.cycle_rate = 0.0 # delta cycles per wall clock second
+        self._last = None
+        self._log = None
+        self._csv = False
+
+    def __str__(self):
+        return "{:.4f}x | {:.0f} cycles/s".format(self.speed, self.cycle_rate)
+
+    def update(self, running: bool, sim_time: int, cycle: int):
+        now = time.monotonic()
+        if self._last is None:
+            self._last = (now, sim_time, cycle) if running else None
+            return
+
+        wall = now - self._last[0]
+        if running and wall < MIN_INTERVAL:
+            return
+
+        last = self._last
+        self._last = (now, sim_time, cycle) if running else None
+        if wall <= 0:
+            return
+
+        speed = (sim_time - last[1]) / 1e9 / wall
+        cycle_rate = (cycle - last[2]) / wall
+        if self.speed or self.cycle_rate:
+            speed = self.smoothing * speed + (1 - self.smoothing) * self.speed
+            cycle_rate = self.smoothing * cycle_rate + \
+                         (1 - self.smoothing) * self.cycle_rate
+
+        self.speed = speed
+        self.cycle_rate = cycle_rate
+        self.write(sim_time, cycle)
+
+    def open_log(self, path: str):
+        self.close_log()
+        self._csv = path.endswith(".csv")
+        self._log = open(path, "a", buffering=1)
+        if self._csv and self._log.tell() == 0:
+            self._log.write("wall,time,cycle,speed,cycle_rate\n")
+
+    def close_log(self):
+        if self._log:
+            self._log.close()
+            self._log = None
+
+    def logging(self) -> bool:
+        return self._log is not None
+
+    def write(self, sim_time: int, cycle: int):
+        if not self._log:
+            return
+
+        wall = time.time()
+        if self._csv:
+            self._log.write("{:.6f},{},{},{:.6f},{:.1f}\n".format(
+                wall, sim_time, cycle, self.speed, self.cycle_rate))
+        else:
+            self._log.write(json.dumps({"wall": wall, "time": sim_time,
+                "cycle": cycle, "speed": self.speed,
+                "cycle_rate": self.cycle_rate}) + "\n")
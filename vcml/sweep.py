@@ -0,0 +1,91 @@
+ ##############################################################################
+ #                                                                            #
+ # Copyright 2024 MachineWare GmbH                                            #
+ #                                                                            #
+ # Licensed under the Apache License, Version 2.0 (the "License");            #
+ # you may not use this file except in compliance with the License.           #
+ # You may obtain a copy of the License at                                    #
+ #                                                                            #
+ #     http://www.apache.org/licenses/LICENSE-2.0                             #
+ #                                                                            #
+ # Unless required by applicable law or agreed to in writing, software        #
+ # distributed under the License is distributed on an "AS IS" BASIS,          #
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+ # See the License for the specific language governing permissions and        #
+ # limitations under the License.                                             #
+ #                                                                            #
+ ##############################################################################
+
+import argparse
+import time
+from collections import namedtuple
+from typing import List
+
+from .session import Session
+
+RESOLUTION = 0.001 # maximum status polling interval during a measurement
+
+UNITS = {"s": 1000000000, "ms": 1000000, "us": 1000, "ns": 1}
+
+SweepResult = namedtuple("SweepResult", "quantum wall simulated cycles")
+
+
+def parse_time(s: str) -> int:
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if s.endswith(unit):
+            return int(float(s[:-len(unit)]) * UNITS[unit])
+    return int(s)
+
+def speed(result: SweepResult) -> float:
+    return result.simulated / 1e9 / result.wall if result.wall else 0.0
+
+def sweep_quantum(session: Session, quanta: List[int], interval: int,
+                  resolution: float = RESOLUTION) -> List[SweepResult]:
+    if session.running():
+        raise Exception("cannot measure while simulation is running")
+
+    results = []
+    original = session.quantum()
+    try:
+        for quantum in quanta:
+            session.set_quantum(quantum)
+            start = session.status()
+            wall = time.perf_counter()
+            session.run(interval)
+            session.wait(interval=resolution)
+            wall = time.perf_counter() - wall
+            end = session.status(False)
+            results.append(SweepResult(quantum, wall, end.time - start.time,
+                                       end.cycle - start.cycle))
+    finally:
+        session.set_quantum(original)
+    return results
+
+def report(results: List[SweepResult]) -> List[str]:
+    fastest = max(results, key=speed) if results else None
+    lines = ["{:>14} {:>10} {:>14} {:>10} {:>12}".format(
+        "quantum (ns)", "wall (s)", "simulated (s)", "cycles", "speed")]
+    for r in results:
+        lines.append("{:>14} {:>10.3f} {:>14.9f} {:>10} {:>11.4f}x{}".format(
+            r.quantum, r.wall, r.simulated / 1e9, r.cycles, speed(r),
+            " *" if r is fastest else ""))
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="measure simulation speed for a series of quanta")
+    parser.add_argument("address", help="session to measure as [host]:<port>")
+    parser.add_argument("-i", "--interval", default="10ms",
+                        help="simulated time to run per quantum")
+    parser.add_argument("quanta", nargs="+",
+                        help="quantum values to measure, e.g. 1us 10us")
+    args = parser.parse_args()
+
+    session = Session(args.address)
+    results = sweep_quantum(session, [parse_time(q) for q in args.quanta],
+                            parse_time(args.interval))
+    for line in report(results):
+        print(line)
+
+if __name__ == "__main__":
+    main()
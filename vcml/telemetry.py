@@ -0,0 +1,223 @@
+ ##############################################################################
+ #                                                                            #
+ # Copyright 2024 MachineWare GmbH                                            #
+ #                                                                            #
+ # Licensed under the Apache License, Version 2.0 (the "License");            #
+ # you may not use this file except in compliance with the License.           #
+ # You may obtain a copy of the License at                                    #
+ #                                                                            #
+ #     http://www.apache.org/licenses/LICENSE-2.0                             #
+ #                                                                            #
+ # Unless required by applicable law or agreed to in writing, software        #
+ # distributed under the License is distributed on an "AS IS" BASIS,          #
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+ # See the License for the specific language governing permissions and        #
+ # limitations under the License.                                             #
+ #                                                                            #
+ ##############################################################################
+
+# Telemetry is published in a shared memory segment with the following
+# layout, all integers and floats are stored in little endian byte order:
+#
+#   offset  size  content
+#   0       4     magic "VCTM"
+#   4       4     u32 layout version, currently 1
+#   8       4     u32 number of values per sample (N)
+#   12      4     u32 number of samples in the ring buffer (H)
+#   16      4     u32 size of the name table in bytes (S), a multiple of 8
+#   20      4     u32 reserved
+#   24      8     u64 sequence counter, odd while a sample is being written
+#   32      8     u64 total number of samples written so far
+#   40      S     value names, UTF-8, separated by newlines, zero padded
+#   40+S    H*R   ring buffer of H samples with R = 16 + 8 * N bytes each:
+#                 u64 simulation time in ns, u64 delta cycle, N f64 values
+#
+# The most recent sample is stored in slot (total - 1) % H. Attributes with
+# more than one element contribute one value per element, named name[i].
+# Values that are not numeric are published as NaN. Readers copy a sample
+# and retry if the sequence counter was odd or changed in the meantime.
+
+import argparse
+import math
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import List
+
+from .session import Session, decode_attributes
+
+MAGIC = b"VCTM"
+LAYOUT = 1
+HEADER = struct.Struct("<4sIIIIIQQ")
+STAMP = struct.Struct("<QQ")
+SEQ_OFFSET = 24
+TOTAL_OFFSET = 32
+HISTORY = 1024 # default number of samples kept in the ring buffer
+INTERVAL = 0.1 # default sampling interval in seconds
+
+_published = set() # names of the segments created by this process
+
+
+def numeric(val: str) -> float:
+    try:
+        return float(int(val, 0))
+    except ValueError:
+        pass
+    try:
+        return float(val)
+    except ValueError:
+        return math.nan
+
+class Publisher:
+    def __init__(self, session: Session, attrs: List, history: int = HISTORY,
+                 name: str = None):
+        self.session = session
+        self.attrs = []
+        self.names = []
+        for a in attrs:
+            attr = session.find_attribute(a) if isinstance(a, str) else a
+            if not attr:
+                raise Exception(f"no such attribute: {a}")
+            self.attrs.append(attr)
+            if attr.count == 1:
+                self.names.append(attr.hierarchy_name())
+            else:
+                self.names += ["{}[{}]".format(attr.hierarchy_name(), i)
+                               for i in range(attr.count)]
+
+        table = "\n".join(self.names).encode()
+        table += b"\0" * (-len(table) % 8)
+        self.history = history
+        self.record = struct.Struct("<QQ{}d".format(len(self.names)))
+        self.base = HEADER.size + len(table)
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+            size=self.base + history * self.record.size)
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, LAYOUT, len(self.names),
+                         history, len(table), 0, 0, 0)
+        self.shm.buf[HEADER.size:self.base] = table
+        _published.add(self.shm.name)
+        self.requests = ["status"] + [a.request() for a in self.attrs
+                                      if a.count]
+        self.total = 0
+        self.seq = 0
+        self._quit = threading.Event()
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def sample(self):
+        res = self.session.pipeline(self.requests)
+        self.session.parse_status(res[0])
+        values = []
+        for attr, val in zip(self.attrs, decode_attributes(self.attrs,
+                                                           res[1:])):
+            if attr.count == 1:
+                values.append(numeric(val))
+            else:
+                values += [numeric(v) for v in val] if attr.count else []
+
+        status = self.session.status(False)
+        offset = self.base + (self.total % self.history) * self.record.size
+        self.seq += 1
+        struct.pack_into("<Q", self.shm.buf, SEQ_OFFSET, self.seq)
+        self.record.pack_into(self.shm.buf, offset, status.time,
+                              status.cycle, *values)
+        self.total += 1
+        struct.pack_into("<Q", self.shm.buf, TOTAL_OFFSET, self.total)
+        self.seq += 1
+        struct.pack_into("<Q", self.shm.buf, SEQ_OFFSET, self.seq)
+
+    def run(self, interval: float = INTERVAL):
+        while not self._quit.is_set():
+            start = time.monotonic()
+            self.sample()
+            self._quit.wait(max(0.0, interval - (time.monotonic() - start)))
+
+    def stop(self):
+        self._quit.set()
+
+    def close(self):
+        _published.discard(self.shm.name)
+        self.shm.close()
+        self.shm.unlink()
+
+class Subscriber:
+    def __init__(self, name: str):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13, attaching registers the segment with the
+            # resource tracker, which would unlink it when the subscriber
+            # exits. The registration is withdrawn again, unless the segment
+            # was published by this process and is still owned by it. The
+            # resource tracker is shared with forked child processes, so
+            # subscribers should not be spawned from the publishing process.
+            from multiprocessing import resource_tracker
+            self.shm = shared_memory.SharedMemory(name=name)
+            if os.name == "posix" and self.shm.name not in _published:
+                resource_tracker.unregister("/" + self.shm.name,
+                                            "shared_memory")
+
+        magic, layout, count, history, size, _, _, _ = \
+            HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or layout != LAYOUT:
+            raise Exception(f"no telemetry found in {name}")
+
+        table = bytes(self.shm.buf[HEADER.size:HEADER.size + size])
+        self.names = table.rstrip(b"\0").decode().split("\n") if count else []
+        self.history = history
+        self.record = struct.Struct("<QQ{}d".format(count))
+        self.base = HEADER.size + size
+
+    def read(self, n: int = 1) -> List:
+        while True:
+            seq, total = STAMP.unpack_from(self.shm.buf, SEQ_OFFSET)
+            if seq % 2:
+                continue
+            samples = []
+            for i in range(max(0, total - min(n, self.history)), total):
+                offset = self.base + (i % self.history) * self.record.size
+                samples.append(self.record.unpack_from(self.shm.buf, offset))
+            if STAMP.unpack_from(self.shm.buf, SEQ_OFFSET)[0] == seq:
+                return samples
+
+    def latest(self) -> dict:
+        samples = self.read(1)
+        if not samples:
+            return None
+        sample = samples[0]
+        values = dict(zip(self.names, sample[2:]))
+        values["_time"] = sample[0]
+        values["_cycle"] = sample[1]
+        return values
+
+    def close(self):
+        self.shm.close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="publish attribute values in shared memory")
+    parser.add_argument("address", help="session to sample as [host]:<port>")
+    parser.add_argument("attributes", nargs="+", help="attributes to sample")
+    parser.add_argument("-n", "--name", help="name of the shared memory")
+    parser.add_argument("-i", "--interval", type=float, default=INTERVAL,
+                        help="sampling interval in seconds")
+    parser.add_argument("--history", type=int, default=HISTORY,
+                        help="number of samples kept in the ring buffer")
+    args = parser.parse_args()
+
+    session = Session(args.address, stop=False)
+    publisher = Publisher(session, args.attributes, args.history, args.name)
+    print(f"publishing {len(publisher.names)} values in {publisher.name}")
+    try:
+        publisher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
+
+if __name__ == "__main__":
+    main()
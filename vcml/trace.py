@@ -0,0 +1,49 @@
+ ##############################################################################
+ #                                                                            #
+ # Copyright 2024 MachineWare GmbH                                            #
+ #                                                                            #
+ # Licensed under the Apache License, Version 2.0 (the "License");            #
+ # you may not use this file except in compliance with the License.           #
+ # You may obtain a copy of the License at                                    #
+ #                                                                            #
+ #     http://www.apache.org/licenses/LICENSE-2.0                             #
+ #                                                                            #
+ # Unless required by applicable law or agreed to in writing, software        #
+ # distributed under the License is distributed on an "AS IS" BASIS,          #
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+ # See the License for the specific language governing permissions and        #
+ # limitations under the License.                                             #
+ #                                                                            #
+ ##############################################################################
+
+from array import array
+from typing import List
+
+
+class Trace:
+    def __init__(self, names: List[str]):
+        self.names: List[str] = list(names)
+        self.time = array("Q")
+        self.cycle = array("Q")
+        self.values = {name: [] for name in self.names}
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, name: str):
+        return self.values[name]
+
+    def append(self, time: int, cycle: int, values: List):
+        if len(values) != len(self.names):
+            raise Exception("expected {} value(s), got {}".format(
+                len(self.names), len(values)))
+
+        self.time.append(time)
+        self.cycle.append(cycle)
+        for name, val in zip(self.names, values):
+            self.values[name].append(val)
+
+    def rows(self):
+        columns = [self.values[name] for name in self.names]
+        for i in range(len(self)):
+            yield [self.time[i], self.cycle[i]] + [c[i] for c in columns]
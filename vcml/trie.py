@@ -0,0 +1,71 @@
+ ##############################################################################
+ #                                                                            #
+ # Copyright 2024 MachineWare GmbH                                            #
+ #                                                                            #
+ # Licensed under the Apache License, Version 2.0 (the "License");            #
+ # you may not use this file except in compliance with the License.           #
+ # You may obtain a copy of the License at                                    #
+ #                                                                            #
+ #     http://www.apache.org/licenses/LICENSE-2.0                             #
+ #                                                                            #
+ # Unless required by applicable law or agreed to in writing, software        #
+ # distributed under the License is distributed on an "AS IS" BASIS,          #
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+ # See the License for the specific language governing permissions and        #
+ # limitations under the License.                                             #
+ #                                                                            #
+ ##############################################################################
+
+import bisect
+from typing import List
+
+
+class Trie:
+    __slots__ = ["children", "terminal", "_names"]
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = False
+        self._names = None
+
+    def __len__(self):
+        return int(self.terminal) + sum(len(c) for c in self.children.values())
+
+    def insert(self, path: List[str]):
+        node = self
+        for name in path:
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = Trie()
+                node._names = None
+            node = child
+        node.terminal = True
+
+    def find(self, path: List[str]):
+        node = self
+        for name in path:
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def names(self) -> List[str]:
+        if self._names is None:
+            self._names = sorted(self.children)
+        return self._names
+
+    def complete(self, prefix: str, sep: str = ".") -> List[str]:
+        *path, last = prefix.split(sep)
+        node = self.find(path)
+        if node is None:
+            return []
+
+        base = prefix[:len(prefix) - len(last)]
+        names = node.names()
+        matches = []
+        for i in range(bisect.bisect_left(names, last), len(names)):
+            if not names[i].startswith(last):
+                break
+            child = node.children[names[i]]
+            matches.append(base + names[i] + (sep if child.children else ""))
+        return matches